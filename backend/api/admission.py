@@ -0,0 +1,170 @@
+# backend/api/admission.py
+
+"""
+Admission control for the LLM-bound serving path.
+
+AdmissionController bounds how many calls run upstream at once. Extra callers wait
+in a short queue with a deadline; when the queue is full, or the deadline passes,
+they get Overloaded right away instead of piling onto OpenAI and all timing out
+together. Waiters are picked by priority first, then by the client with the fewest
+calls already running, so one busy client can't starve everyone else.
+
+ResponseCache holds recent answers so that, when the LLM is saturated, the endpoint
+can answer from cache or from retrieval alone rather than failing.
+"""
+
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """
+    Raised when a call can't be admitted. status_code/retry_after map straight onto the HTTP response.
+    """
+    def __init__(self, reason, status_code=503, retry_after=1):
+        super().__init__(reason)
+        self.reason      = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, client_id, priority, seq):
+        self.client_id = client_id
+        self.priority  = priority
+        self.seq       = seq
+        self.admitted  = False
+
+
+class AdmissionController:
+    """
+    Bounded concurrency pool with a deadline-bounded, priority + fair-share queue.
+    Lower priority numbers are served first.
+    """
+    def __init__(self, max_concurrent, max_queue, queue_timeout, per_client_max=None, name="upstream"):
+        self.max_concurrent = max_concurrent
+        self.max_queue      = max_queue
+        self.queue_timeout  = queue_timeout
+        self.per_client_max = per_client_max
+        self.name           = name
+        self._active        = 0
+        self._by_client     = {}    # client id -> calls running or waiting
+        self._running       = {}    # client id -> calls running
+        self._queue         = []
+        self._seq           = itertools.count()
+        self._cond          = threading.Condition()
+
+    @property
+    def saturated(self) -> bool:
+        return self._active >= self.max_concurrent
+
+    def _retry_after(self) -> int:
+        # rough guess, one queue timeout per "layer" of queued work
+        layers = 1 + len(self._queue) // max(self.max_concurrent, 1)
+        return max(1, int(layers * self.queue_timeout))
+
+    def _next_waiter(self):
+        return min(self._queue, key=lambda w: (w.priority, self._running.get(w.client_id, 0), w.seq))
+
+    def _dispatch(self):
+        # hand free slots to the best waiters, must hold the lock
+        while self._queue and self._active < self.max_concurrent:
+            w = self._next_waiter()
+            self._queue.remove(w)
+            w.admitted = True
+            self._admit(w.client_id)
+        self._cond.notify_all()
+
+    def _admit(self, client_id):
+        self._active += 1
+        self._running[client_id] = self._running.get(client_id, 0) + 1
+
+    def _forget(self, client_id):
+        n = self._by_client.get(client_id, 0) - 1
+        if n > 0:
+            self._by_client[client_id] = n
+        else:
+            self._by_client.pop(client_id, None)
+
+    def acquire(self, client_id="anonymous", priority=1, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self.per_client_max and self._by_client.get(client_id, 0) >= self.per_client_max:
+                raise Overloaded("too many concurrent requests from client", status_code=429,
+                                 retry_after=self._retry_after())
+            self._by_client[client_id] = self._by_client.get(client_id, 0) + 1
+
+            if self._active < self.max_concurrent and not self._queue:
+                self._admit(client_id)
+                return
+            if len(self._queue) >= self.max_queue or timeout <= 0:
+                self._forget(client_id)
+                raise Overloaded(f"{self.name} queue full", retry_after=self._retry_after())
+
+            w = _Waiter(client_id, priority, next(self._seq))
+            self._queue.append(w)
+            while not w.admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(w)
+                    self._forget(client_id)
+                    raise Overloaded(f"{self.name} queue deadline exceeded", retry_after=self._retry_after())
+                self._cond.wait(remaining)
+
+    def release(self, client_id="anonymous"):
+        with self._cond:
+            self._active -= 1
+            n = self._running.get(client_id, 0) - 1
+            if n > 0:
+                self._running[client_id] = n
+            else:
+                self._running.pop(client_id, None)
+            self._forget(client_id)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client_id="anonymous", priority=1, timeout=None):
+        self.acquire(client_id, priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(client_id)
+
+
+class ResponseCache:
+    """
+    Small thread-safe LRU with TTL, used for degraded-mode answers.
+    """
+    def __init__(self, max_items=1000, ttl=60 * 60):
+        self.max_items = max_items
+        self.ttl       = ttl
+        self._items    = OrderedDict()
+        self._lock     = threading.Lock()
+
+    @staticmethod
+    def key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    def get(self, question):
+        k = self.key(question)
+        with self._lock:
+            item = self._items.get(k)
+            if item is None:
+                return None
+            if time.time() - item[0] > self.ttl:
+                del self._items[k]
+                return None
+            self._items.move_to_end(k)
+            return item[1]
+
+    def put(self, question, value):
+        k = self.key(question)
+        with self._lock:
+            self._items[k] = (time.time(), value)
+            self._items.move_to_end(k)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
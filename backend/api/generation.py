@@ -0,0 +1,217 @@
+# backend/api/generation.py
+
+"""
+Answer generation for the `/query` endpoint:
+  1. Builds the fused prompt under a token budget. Snippets are deduped and
+     ordered by search score, and entity summaries are capped.
+  2. Picks the model. Simple lookups with confident retrieval go to the cheap
+     model; low-confidence or multi-fact questions escalate to the large one.
+  3. Logs the routing decision plus estimated and actual token counts.
+"""
+
+import os
+import re
+import time
+
+CHEAP_MODEL  = os.getenv("CHEAP_MODEL", "gpt-4o-mini")
+STRONG_MODEL = os.getenv("STRONG_MODEL", "gpt-4o")
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))  # user prompt, system prompt not included
+MAX_ENTITIES        = 10     # entity summaries are cheap context, not worth a budget fight
+CONTEXT_SHARE       = 0.5    # share of the budget reserved for snippets before history gets any
+MAX_SUMMARY_TOKENS  = 200    # rolling conversation summary is capped, verbatim turns are trimmed instead
+MIN_TOP_SCORE       = float(os.getenv("ROUTER_MIN_TOP_SCORE", "2.0"))  # below this retrieval is "unsure"
+MIN_CONFIDENT_HITS  = 2      # fewer usable snippets than this escalates too
+
+# Wording that usually means combining several facts, not looking one up
+MULTI_FACT_RE = re.compile(
+    r"\b(compare|comparison|difference|differ|versus|vs\.?|between|both|which is better|"
+    r"instead of|substitut\w*|why|explain|step[- ]by[- ]step|plan|all the|list all)\b",
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 chars per token for English, close enough for budgeting"""
+    return len(text) // 4 + 1
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def dedupe_snippets(chunks: list) -> list:
+    """
+    Drop empty snippets, and when one snippet contains another keep the longer one with
+    the higher of the two scores, so a short high-scoring prefix can't push out the full
+    excerpt. Returned highest-scoring first.
+    """
+    kept = []  # [(normalised text, chunk)]
+    for c in chunks:
+        text = _norm(c.get("text_excerpt", ""))
+        if not text:
+            continue
+        for i, (seen, other) in enumerate(kept):
+            if text in seen or seen in text:
+                longer = c if len(text) > len(seen) else other
+                kept[i] = (max(text, seen, key=len), dict(
+                    longer,
+                    score=max(c.get("score") or 0.0, other.get("score") or 0.0),
+                    carried=bool(c.get("carried") and other.get("carried")),
+                ))
+                break
+        else:
+            kept.append((text, c))
+    return sorted((c for _, c in kept), key=lambda c: c.get("score") or 0.0, reverse=True)
+
+
+def dedupe_entities(entity_summaries: list, cap=MAX_ENTITIES) -> list:
+    kept, seen = [], set()
+    for ent in entity_summaries:
+        key = _norm(ent)
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(ent)
+        if len(kept) >= cap:
+            break
+    return kept
+
+
+def cap_summary(summary: str, max_tokens: int = MAX_SUMMARY_TOKENS) -> str:
+    """Keep the newest end of the rolling summary, cut at a word boundary"""
+    if estimate_tokens(summary) <= max_tokens:
+        return summary
+    if max_tokens <= 0:
+        return ""
+    cut = summary[-max_tokens * 4:]
+    return "..." + cut[cut.find(" ") + 1:] if " " in cut else cut
+
+
+def render_history(summary: str, turns: list, max_tokens: int) -> str:
+    """
+    Summary plus as many whole verbatim turns as fit in max_tokens. The summary is capped
+    (to at most half of max_tokens) rather than dropped, and whole turns are dropped oldest
+    first, so the newest exchange survives longest and every section keeps its header.
+    """
+    summary = cap_summary(summary, min(MAX_SUMMARY_TOKENS, max_tokens // 2))
+    head = f"Summary of the earlier conversation:\n{summary}\n" if summary else ""
+    if head and estimate_tokens(head) > max_tokens:
+        head = ""
+    header = "\nMost recent conversation turns:\n"
+    left = max_tokens - estimate_tokens(head) - estimate_tokens(header)
+
+    recent = []
+    for t in reversed(turns):
+        line = f"User: {t['question']}\nAssistant: {t['answer']}\n"
+        cost = estimate_tokens(line)
+        if cost > left:
+            break
+        recent.append(line)
+        left -= cost
+    if recent:
+        head += header + "".join(reversed(recent))
+    return head
+
+
+def build_prompt(question: str, chunks: list, entity_summaries: list, summary: str = "",
+                 turns: list = (), budget: int = PROMPT_TOKEN_BUDGET):
+    """
+    Fused prompt that stays under budget. The question always goes in, snippets get up to
+    CONTEXT_SHARE of the budget ahead of history, history gets what's left after that
+    (capped summary, then whole turns newest first), then remaining snippets in score
+    order, then entities.
+    Returns (prompt, stats), stats["kept"] is the chunks that made it into the prompt.
+    """
+    tail = f"\nAnswer this question: {question}\n"
+    used = estimate_tokens(tail)
+
+    candidates = [(c, f"- {c['text_excerpt']}\n") for c in dedupe_snippets(chunks)]
+    reserve = min(sum(estimate_tokens(line) for _, line in candidates), int(budget * CONTEXT_SHARE))
+    history = render_history(summary, turns, budget - used - reserve)
+    head = history + "\n" if history else ""
+    used += estimate_tokens(head)
+
+    snippets, kept, dropped = [], [], 0
+    for c, line in candidates:
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            dropped += 1
+            continue
+        snippets.append(line)
+        kept.append(c)
+        used += cost
+
+    entities = []
+    for ent in dedupe_entities(entity_summaries):
+        line = f"- {ent}\n"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            break
+        entities.append(line)
+        used += cost
+
+    prompt = head + "Here are the relevant excerpts:\n" + "".join(snippets)
+    if entities:
+        prompt += "\nHere are related entities:\n" + "".join(entities)
+    prompt += tail
+
+    stats = {
+        "est_prompt_tokens": used,
+        "snippets_in": len(chunks),
+        "snippets_used": len(snippets),
+        "snippets_over_budget": dropped,
+        "entities_in": len(entity_summaries),
+        "entities_used": len(entities),
+        "kept": kept,
+    }
+    return prompt, stats
+
+
+def choose_model(question: str, chunks: list):
+    """
+    Route to CHEAP_MODEL unless retrieval looks weak or the question needs several facts.
+    chunks should be this turn's search hits that made it into the prompt, carried-over
+    chunks keep the previous query's score and say nothing about this one.
+    Returns (model, reason).
+    """
+    if MULTI_FACT_RE.search(question) or question.count("?") > 1:
+        return STRONG_MODEL, "multi-fact question"
+    usable = [c for c in chunks if c.get("text_excerpt")]
+    if len(usable) < MIN_CONFIDENT_HITS:
+        return STRONG_MODEL, f"only {len(usable)} usable snippets"
+    top = max((c.get("score") or 0.0) for c in usable)
+    if top < MIN_TOP_SCORE:
+        return STRONG_MODEL, f"low retrieval score {top:.2f}"
+    return CHEAP_MODEL, f"simple lookup, top score {top:.2f}"
+
+
+def generate(client, system_prompt: str, question: str, chunks: list, entity_summaries: list,
+             summary: str = "", turns: list = ()) -> str:
+    """
+    Build the budgeted prompt, route it and call the LLM.
+    summary and turns are the session's rolling summary and recent verbatim turns.
+    """
+    prompt, stats = build_prompt(question, chunks, entity_summaries, summary, turns)
+    model, reason = choose_model(question, [c for c in stats["kept"] if not c.get("carried")])
+
+    start = time.monotonic()
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system",  "content": system_prompt},
+            {"role": "user",    "content": prompt}
+            ]
+    )
+    latency = time.monotonic() - start
+
+    usage = getattr(response, "usage", None)
+    print(
+        f"[generation] model={model} reason=\"{reason}\" latency={latency:.2f}s "
+        f"est_prompt_tokens={stats['est_prompt_tokens']} "
+        f"prompt_tokens={getattr(usage, 'prompt_tokens', None)} "
+        f"completion_tokens={getattr(usage, 'completion_tokens', None)} "
+        f"snippets={stats['snippets_used']}/{stats['snippets_in']} "
+        f"entities={stats['entities_used']}/{stats['entities_in']}"
+    )
+    return response.choices[0].message.content.strip()
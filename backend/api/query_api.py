@@ -6,18 +6,30 @@
 This module provides a unified `/query` endpoint that:
   1. Performs a semantic search (vector) against Azure Cognitive Search
   2. Fetches related entities from the Cosmos DB Gremlin graph
-  3. Constructs a fused prompt and queries the LLM for an answer
+  3. Constructs a fused prompt and queries the LLM for an answer (see generation.py)
 
+Follow-up questions are answered in the context of a server-side session
+(see session_store.py), so the client only ever sends the new question.
+
+Upstream search and LLM calls go through admission gates (see admission.py) so
+overload turns into fast 503s or degraded answers instead of a pile of timeouts.
 """
 
 import os
-from fastapi import APIRouter, HTTPException
+import re
+import time
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import AzureError
 from azure.search.documents import SearchClient
 from backend.graph_rag.graph_query import query_graph
-from openai import OpenAI
+from backend.api.session_store import SessionStore, SqliteSessionBackend
+from backend.api.admission import AdmissionController, Overloaded, ResponseCache
+from backend.api.generation import generate
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
 
 DOMAIN_PROMPT = """
 You are a Nestlé chatbot. Classify user questions into exactly one of these domains:
@@ -39,6 +51,20 @@ You are NestléSiteBot, the official virtual assistant for madewithnestle.ca.
 Dont mention the context or excerpts i provide you the user shouldnt see im providing you context. Only be positive and helpful never negative about the company
 """
 
+SUMMARY_PROMPT = """
+You maintain a short running summary of a chat between a user and the Nestlé site assistant.
+Update the existing summary with the new turns. Keep product, recipe and policy names, and any
+user preferences (e.g. dietary needs). Respond with the updated summary only, under 120 words.
+"""
+
+REUSE_PREV_CHUNKS  = 2    # previous-turn chunks carried into a follow-up's context
+FOLLOWUP_MIN_SCORE = float(os.getenv("FOLLOWUP_MIN_SCORE", "2.0"))  # weaker top hit means the question leans on the last turn
+STOPWORDS = {"what", "about", "with", "this", "that", "there", "have", "does", "which", "from",
+             "your", "them", "they", "then", "than", "would", "could", "should", "make", "version"}
+
+BUSY_PREFIX = "I'm handling a lot of questions right now, so here is what I found on madewithnestle.ca:\n"
+NOTHING_FOUND = "Sorry, I couldn't find anything on madewithnestle.ca about that. Could you rephrase the question?"
+
 # --------------------
 # Load environment
 # --------------------
@@ -51,12 +77,38 @@ search_client = SearchClient(
     credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_ADMIN_KEY"))
 )
 
-# OpenAI config
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Admission control config
+LLM_CONCURRENCY    = int(os.getenv("LLM_CONCURRENCY", "8"))       # OpenAI calls in flight
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "16"))   # search + graph calls in flight
+QUEUE_SIZE         = int(os.getenv("ADMISSION_QUEUE_SIZE", "32")) # waiters per gate before we shed
+PER_CLIENT_MAX     = int(os.getenv("ADMISSION_PER_CLIENT", "4"))  # running + waiting calls per client
+QUEUE_TIMEOUT      = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5")) # longest wait in any one gate queue
+REQUEST_DEADLINE   = float(os.getenv("REQUEST_DEADLINE", "30"))   # whole request: queueing + every upstream call
+LLM_TIMEOUT        = float(os.getenv("LLM_TIMEOUT", "20"))        # cap per OpenAI call, less if the deadline is closer
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))    # proxies appending to X-Forwarded-For (App Service = 1)
+DEGRADED_MODE      = os.getenv("DEGRADED_MODE", "1") == "1"       # answer from cache/retrieval when LLM is saturated
 
+# Everything that means "the LLM is busy or unreachable", not "our request is wrong".
+# With max_retries=0 these surface straight away: 429s, timeouts/connection resets
+# (APITimeoutError is an APIConnectionError) and any 5xx (InternalServerError covers >= 500)
+LLM_UNAVAILABLE = (Overloaded, RateLimitError, APIConnectionError, InternalServerError)
 
-def detect_domain_llm(question: str) -> str:
-    resp = client.chat.completions.create(
+llm_gate = AdmissionController(LLM_CONCURRENCY, QUEUE_SIZE, QUEUE_TIMEOUT, PER_CLIENT_MAX, name="llm")
+search_gate = AdmissionController(SEARCH_CONCURRENCY, QUEUE_SIZE, QUEUE_TIMEOUT, PER_CLIENT_MAX, name="search")
+answer_cache = ResponseCache()
+
+# OpenAI config, no retries so 429s don't stack up behind the gate, timeouts are set per call
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=LLM_TIMEOUT, max_retries=0)
+
+
+def llm(timeout: float):
+    """OpenAI client bounded to timeout seconds for one call"""
+    if timeout <= 0:
+        raise Overloaded("request deadline exceeded")
+    return client.with_options(timeout=min(timeout, LLM_TIMEOUT), max_retries=0)
+
+def detect_domain_llm(question: str, timeout: float = LLM_TIMEOUT) -> str:
+    resp = llm(timeout).chat.completions.create(
       model="gpt-4o-mini",
       messages=[
         {"role":"system", "content": DOMAIN_PROMPT},
@@ -69,6 +121,30 @@ def detect_domain_llm(question: str) -> str:
     print(domain)
     return domain if domain in {"product","recipe","policy"} else "off-topic"
 
+def summarize_turns(summary: str, turns: list, timeout: float = LLM_TIMEOUT) -> str:
+    """
+    Fold turns that left the verbatim window into the rolling summary.
+    """
+    convo = "\n".join(f"User: {t['question']}\nAssistant: {t['answer']}" for t in turns)
+    # never queue for this, if the LLM is saturated the store keeps the turns pending
+    with llm_gate.slot("summarizer", timeout=0):
+        resp = llm(timeout).chat.completions.create(
+          model="gpt-4o-mini",
+          messages=[
+            {"role":"system", "content": SUMMARY_PROMPT},
+            {"role":"user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew turns:\n{convo}"}
+          ],
+          temperature=0.0
+        )
+    return resp.choices[0].message.content.strip()
+
+# Session store, persisted locally only if SESSION_DB_PATH is set
+session_db = os.getenv("SESSION_DB_PATH")
+sessions = SessionStore(
+    summarize=summarize_turns,
+    backend=SqliteSessionBackend(session_db) if session_db else None
+)
+
 # --------------------
 # 2) Initialize FastAPI
 # --------------------
@@ -79,67 +155,180 @@ router = APIRouter()
 # --------------------
 class QueryRequest(BaseModel):
     question: str
+    session_id: Optional[str] = None
 
 class QueryResponse(BaseModel):
     answer: str
     chunk_ids: list
     entity_ids: list
+    session_id: str
+    degraded: bool = False
+
+# --------------------
+# Admission helpers
+# --------------------
+def client_key(request: Request) -> str:
+    """
+    Identify the caller for fair-share limiting. Each trusted proxy appends the address it
+    saw to X-Forwarded-For, so only the last TRUSTED_PROXY_HOPS entries can be believed,
+    anything to the left of them is whatever the client chose to send.
+    """
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    if TRUSTED_PROXY_HOPS > 0 and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "anonymous"
+
+def remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+def queue_wait(deadline: float) -> float:
+    return min(QUEUE_TIMEOUT, remaining(deadline))
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail="We're getting a lot of questions right now, please try again in a moment.",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def search_chunks(search_text: str, client_id: str, priority: int, deadline: float) -> list:
+    """Top-5 search hits as chunk dicts, raises Overloaded if the search gate is full"""
+    with search_gate.slot(client_id, priority, timeout=queue_wait(deadline)):
+        budget = remaining(deadline)
+        if budget <= 0:
+            raise Overloaded("request deadline exceeded")
+        try:
+            results = list(search_client.search(
+                search_text=search_text,
+                top=5,
+                timeout=budget,
+                read_timeout=budget
+            ))
+        except AzureError as e:
+            # a search timeout under load is shed like a full queue
+            raise Overloaded(f"search failed: {e}")
+    return [{
+        "id": doc["id"],
+        "text_excerpt": doc.get("text_excerpt", ""),
+        "url": doc.get("url", ""),
+        "score": doc.get("@search.score", 0.0)
+    } for doc in results]
+
+def weak_results(chunks: list) -> bool:
+    usable = [c for c in chunks if c["text_excerpt"]]
+    return len(usable) < 2 or max(c["score"] or 0.0 for c in usable) < FOLLOWUP_MIN_SCORE
+
+def content_words(text: str) -> set:
+    return {w for w in re.findall(r"\w+", text.lower()) if len(w) > 3 and w not in STOPWORDS}
+
+def carryover_chunks(session, question: str, chunks: list, followup: bool) -> list:
+    """
+    Previous-turn chunks worth keeping for this question: all of them when the question
+    only makes sense as a follow-up, otherwise just the ones sharing words with it.
+    """
+    seen_ids = {c["id"] for c in chunks}
+    words = content_words(question)
+    carried = [
+        dict(c, carried=True) for c in session.last_chunks
+        if c["id"] not in seen_ids and (followup or words & content_words(c["text_excerpt"]))
+    ]
+    return carried[:REUSE_PREV_CHUNKS]
+
+def retrieval_only_answer(chunks: list) -> str:
+    """Degraded answer built straight from the search hits, no LLM involved"""
+    lines = [f"- {c['text_excerpt']}" + (f" ({c['url']})" if c.get("url") else "") for c in chunks if c["text_excerpt"]]
+    return BUSY_PREFIX + "\n".join(lines)
 
 # --------------------
 # Unified query endpoint
 # --------------------
 @router.post("", response_model=QueryResponse)
-def query(req: QueryRequest):
+def query(req: QueryRequest, request: Request, background_tasks: BackgroundTasks):
     """
     1) Vector-search Azure Cognitive Search
     2) Graph-traverse Cosmos DB Gremlin
     3) Build prompt and query LLM
     """
     #print("HIT QUERY ENDPOINT")
-    # Vector search
-    domain = detect_domain_llm(req.question)
+    session = sessions.get_or_create(req.session_id)
+    client_id = client_key(request)
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    priority = 0 if session.turns else 1  # keep ongoing conversations responsive first
+    # first-turn answers don't depend on history so they can be cached and reused
+    cacheable = not session.turns
+
+    # Domain check is a nice-to-have, skip it rather than wait when the LLM is busy
+    try:
+        with llm_gate.slot(client_id, priority, timeout=0):
+            domain = detect_domain_llm(req.question, timeout=min(3.0, remaining(deadline)))
+    except LLM_UNAVAILABLE:
+        domain = "product"
     if not domain:
         # off-topic
         raise HTTPException(
             status_code=400,
             detail="Sorry—I only answer questions about Nestlé products, recipes, or policies."
         )
-    results = search_client.search(
-        search_text=req.question,
-        top=5
-    )
-    chunk_ids = [doc["id"] for doc in results]
-    snippets = [doc.get("text_excerpt", "") for doc in results]
-    if not chunk_ids: #empty chunk ids crashes gremlin query fix later
-        return []
-    # Graph retrieval
-    entities = query_graph(chunk_ids, max_hops=1)
+    try:
+        chunks = search_chunks(req.question, client_id, priority, deadline)
+        # follow-ups like "what about gluten-free?" search weakly on their own,
+        # retry those with the last question for context
+        followup = bool(session.turns) and weak_results(chunks)
+        if followup:
+            chunks = search_chunks(f"{session.turns[-1]['question']} {req.question}",
+                                   client_id, priority, deadline)
+    except Overloaded as e:
+        cached = answer_cache.get(req.question) if cacheable and DEGRADED_MODE else None
+        if cached is None:
+            raise overloaded_error(e)
+        return QueryResponse(**cached, session_id=session.session_id, degraded=True)
+    new_chunks = chunks
+
+    # carry over the previous turn's chunks the new search didn't return, when still relevant
+    if session.turns:
+        chunks = chunks + carryover_chunks(session, req.question, chunks, followup)
+
+    chunk_ids = [c["id"] for c in chunks]
+    if not chunk_ids:
+        # nothing to ground an answer on (and an empty id list crashes the gremlin query)
+        return QueryResponse(answer=NOTHING_FOUND, chunk_ids=[], entity_ids=[],
+                             session_id=session.session_id)
+    # Graph retrieval, entities only enrich the prompt so skip them if search/graph is saturated
+    try:
+        with search_gate.slot(client_id, priority, timeout=queue_wait(deadline)):
+            entities = query_graph(chunk_ids, max_hops=1)
+    except Overloaded:
+        entities = []
     entity_ids = [e["id"] for e in entities]
     entity_summaries = [f"{e['name']} ({e['type']})" for e in entities]
 
-    # Construct fused prompt
-    prompt = "Here are the relevant excerpts:\n"
-    for snip in snippets:
-        prompt += f"- {snip}\n"
-    if entity_summaries:
-        prompt += "\nHere are related entities:\n"
-        for ent in entity_summaries:
-            prompt += f"- {ent}\n"
-    prompt += f"\nAnswer this question: {req.question}\n"
-
-    # Query the LLM
-    response = client.chat.completions.create(
-        model="gpt-4o",  # or your chosen deployment
-        messages=[
-            {"role": "system",  "content": SYSTEM_PROMPT},
-            {"role": "user",    "content": prompt}
-            ]
-    )
-    answer = response.choices[0].message.content.strip()
+    # Build the budgeted prompt, route to a model and query the LLM
+    degraded = False
+    try:
+        with llm_gate.slot(client_id, priority, timeout=queue_wait(deadline)):
+            answer = generate(llm(remaining(deadline)), SYSTEM_PROMPT, req.question, chunks, entity_summaries,
+                              summary=session.summary, turns=list(session.turns))
+    except LLM_UNAVAILABLE as e:
+        if not DEGRADED_MODE:
+            raise overloaded_error(e if isinstance(e, Overloaded) else Overloaded(str(e)))
+        print(f"[query] degraded answer: {e}")
+        cached = answer_cache.get(req.question) if cacheable else None
+        answer = cached["answer"] if cached else retrieval_only_answer(chunks)
+        degraded = True
+
+    if not degraded:
+        # only the new search results are remembered, so carried chunks age out after one turn
+        if sessions.record_turn(session, req.question, answer, new_chunks):
+            # summarising evicted turns runs after the response is sent, off the request's deadline
+            background_tasks.add_task(sessions.fold, session, LLM_TIMEOUT)
+        if cacheable:
+            answer_cache.put(req.question, {"answer": answer, "chunk_ids": chunk_ids, "entity_ids": entity_ids})
 
     return QueryResponse(
         answer=answer,
         chunk_ids=chunk_ids,
-        entity_ids=entity_ids
+        entity_ids=entity_ids,
+        session_id=session.session_id,
+        degraded=degraded
     )
 
@@ -0,0 +1,222 @@
+# backend/api/session_store.py
+
+"""
+Server-side conversation sessions for the `/query` endpoint.
+
+Each session keeps:
+  1. The last MAX_TURNS question/answer pairs verbatim
+  2. A rolling summary of everything older, updated one evicted turn at a time
+  3. The chunks retrieved for the previous turn so follow-ups can reuse them
+
+That keeps the prompt for turn 50 the same size as the prompt for turn 5.
+Sessions live in memory; set SESSION_DB_PATH to also persist them to a local
+sqlite file so they survive a restart.
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+
+MAX_TURNS    = 4        # turns kept verbatim, older ones get folded into the summary
+MAX_PENDING  = 4        # extra verbatim turns held while the summariser is failing
+MAX_SESSIONS = 5000     # in-memory LRU cap
+SESSION_TTL  = 60 * 60  # seconds of inactivity before a session is dropped
+PURGE_EVERY  = 10 * 60  # seconds between sweeps of expired rows in the sqlite backend
+
+
+class Session:
+    """
+    One conversation: recent turns, rolling summary and last retrieved chunks.
+    """
+    def __init__(self, session_id, turns=None, summary="", last_chunks=None, updated_at=None):
+        self.session_id  = session_id
+        self.turns       = turns or []        # [{"question": ..., "answer": ...}]
+        self.summary     = summary
+        self.last_chunks = last_chunks or []  # [{"id": ..., "text_excerpt": ...}]
+        self.updated_at  = updated_at or time.time()
+        self.lock        = threading.Lock()  # serialises append / fold / save on this session
+        self.folding     = False
+
+    def to_dict(self):
+        return {
+            "session_id":  self.session_id,
+            "turns":       self.turns,
+            "summary":     self.summary,
+            "last_chunks": self.last_chunks,
+            "updated_at":  self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["session_id"],
+            turns=d.get("turns"),
+            summary=d.get("summary", ""),
+            last_chunks=d.get("last_chunks"),
+            updated_at=d.get("updated_at"),
+        )
+
+
+class SqliteSessionBackend:
+    """
+    Optional local persistence, one JSON row per session.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return Session.from_dict(json.loads(row[0])) if row else None
+
+    def save(self, session):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session.session_id, json.dumps(session.to_dict(), ensure_ascii=False), session.updated_at)
+            )
+            self._conn.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge_older_than(self, cutoff):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            self._conn.commit()
+
+
+class SessionStore:
+    """
+    In-memory LRU of sessions keyed by session id, optionally backed by sqlite.
+
+    `summarize(previous_summary, evicted_turns, timeout) -> str` is called only when
+    turns fall out of the verbatim window, so the summary is updated incrementally
+    instead of re-summarising the whole chat every turn. record_turn() only appends and
+    persists; fold() does the summariser call and is meant to run after the response has
+    been sent. If it fails the turns stay verbatim and are folded on a later turn; past
+    MAX_PENDING of them they are folded as plain question topics so the history stays bounded.
+    """
+    def __init__(self, summarize=None, backend=None, max_turns=MAX_TURNS,
+                 max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.summarize    = summarize
+        self.backend      = backend
+        self.max_turns    = max_turns
+        self.max_sessions = max_sessions
+        self.ttl          = ttl
+        self._sessions    = OrderedDict()
+        self._lock        = threading.Lock()
+        self._last_purge  = 0.0
+        self._purge(time.time())
+
+    def get_or_create(self, session_id=None) -> Session:
+        """
+        Return the live session for session_id, or start a new one.
+        Unknown or expired ids get a freshly minted id, clients never pick their own.
+        """
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None and session_id and self.backend:
+                session = self.backend.load(session_id)
+            if session is not None and now - session.updated_at > self.ttl:
+                self._drop(session.session_id)
+                session = None
+            if session is None:
+                session = Session(uuid.uuid4().hex)
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            self._evict()
+            if now - self._last_purge > PURGE_EVERY:
+                self._purge(now)
+        return session
+
+    def record_turn(self, session, question, answer, chunks) -> bool:
+        """
+        Append a turn, remember the chunks and persist.
+        Returns True when the verbatim window overflowed and fold() should be scheduled.
+        """
+        with session.lock:
+            session.turns.append({"question": question, "answer": answer})
+            session.last_chunks = chunks
+            session.updated_at = time.time()
+            self._save(session)
+            return len(session.turns) > self.max_turns
+
+    def fold(self, session, timeout=None):
+        """
+        Fold turns that fell out of the verbatim window into the summary.
+        The summariser runs outside the session lock so a follow-up request isn't held up
+        by it; only one fold per session runs at a time.
+        """
+        with session.lock:
+            if session.folding or len(session.turns) <= self.max_turns:
+                return
+            session.folding = True
+            base = session.summary
+            evicted = session.turns[:-self.max_turns]
+
+        summary = self._fold(base, evicted, timeout)
+
+        with session.lock:
+            session.folding = False
+            if summary is None and len(evicted) > MAX_PENDING:
+                # summariser keeps failing, don't let the verbatim history grow without bound
+                summary = self._topics(base, evicted)
+            if summary is None:
+                return
+            # only appends happen while folding, so the evicted turns are still at the front
+            session.summary = summary
+            session.turns = session.turns[len(evicted):]
+            self._save(session)
+
+    @staticmethod
+    def _topics(summary, evicted):
+        # cheap fallback summary, just keep the question topics around
+        topics = "; ".join(t["question"] for t in evicted)
+        return (summary + " " + topics).strip()[-2000:]
+
+    def _fold(self, summary, evicted, timeout):
+        """New summary, or None if the summariser failed and the turns should stay pending"""
+        if self.summarize is None:
+            return self._topics(summary, evicted)
+        try:
+            return self.summarize(summary, evicted, timeout)
+        except Exception as e:
+            # a failed summary must never lose the user's turns
+            print(f"[session_store] summarize failed, keeping {len(evicted)} turns pending: {e}")
+            return None
+
+    def _save(self, session):
+        if self.backend:
+            self.backend.save(session)
+
+    def _drop(self, session_id):
+        self._sessions.pop(session_id, None)
+        if self.backend:
+            self.backend.delete(session_id)
+
+    def _evict(self):
+        # LRU cap only drops from memory, persisted sessions can be reloaded
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _purge(self, now):
+        # expired rows are never looked up again, sweep them so the db doesn't grow forever
+        self._last_purge = now
+        if self.backend:
+            self.backend.purge_older_than(now - self.ttl)
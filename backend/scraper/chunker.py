@@ -1,9 +1,12 @@
 import json
 from backend.config import PAGES_JSONL, CHUNKS_JSONL
 from backend.scraper.utils import infer_domain_from_url
+from backend.scraper.extract import BoilerplateFilter, blocks_to_text
 
 '''
 Breaks down scraped pages into chunks of 3000 chars and categorises them into groups for more optomized searches
+Blocks repeated across many pages (header, footer, cookie text) are stripped first, and chunks
+break on headings where possible so ingredient lists stay with their recipe
 '''
 
 MAX_CHARS = 3000
@@ -22,14 +25,52 @@ def chunk_text(text):
         chunks.append(buffer.strip())
     return chunks
 
+#Split structured blocks into chunks of MAX_CHAR, starting a new chunk at a heading once the current one is half full
+def chunk_blocks(blocks):
+    chunks, buffer = [], []
+    size = 0
+    for b in blocks:
+        text = blocks_to_text([b])
+        if len(text) >= MAX_CHARS: # one huge block, fall back to sentence splitting
+            if buffer:
+                chunks.append("\n".join(buffer))
+                buffer, size = [], 0
+            chunks.extend(chunk_text(text))
+            continue
+        if buffer and (size + len(text) + 1 >= MAX_CHARS or (b["kind"] == "heading" and size > MAX_CHARS // 2)):
+            chunks.append("\n".join(buffer))
+            buffer, size = [], 0
+        buffer.append(text)
+        size += len(text) + 1
+    if buffer:
+        chunks.append("\n".join(buffer))
+    return chunks
+
+def load_pages(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
 #Read pages from pages jsonl and writes each chunk with its index and domain into chunks json
-with open(PAGES_JSONL, 'r', encoding='utf-8') as infile, open(CHUNKS_JSONL, 'w', encoding='utf-8') as out:
-    for line in infile:
-        rec = json.loads(line)
-        print("added chunk")
-        for i, chunk in enumerate(chunk_text(rec['text'])):
-            if len(chunk) > 0:
-                domain = infer_domain_from_url(rec['url'])
+def main():
+    #First pass learns which blocks repeat across the crawl
+    boilerplate = BoilerplateFilter()
+    for rec in load_pages(PAGES_JSONL):
+        if 'blocks' in rec:
+            boilerplate.observe(rec['blocks'])
+    print(f"Learned boilerplate from {boilerplate.pages} pages")
+
+    with open(CHUNKS_JSONL, 'w', encoding='utf-8') as out:
+        for rec in load_pages(PAGES_JSONL):
+            print("added chunk")
+            if 'blocks' in rec:
+                chunks = chunk_blocks(boilerplate.strip(rec['blocks']))
+            else: # pages scraped before blocks were stored
+                chunks = chunk_text(rec['text'])
+            domain = infer_domain_from_url(rec['url'])
+            for i, chunk in enumerate(chunks):
+                if len(chunk) == 0:
+                    continue
                 out.write(json.dumps({
                     "url": rec['url'],
                     "timestamp": rec['timestamp'],
@@ -37,3 +78,6 @@ with open(PAGES_JSONL, 'r', encoding='utf-8') as infile, open(CHUNKS_JSONL, 'w',
                     "chunk_index": i,
                     "text": chunk
                 }) + "\n")
+
+if __name__ == "__main__":
+    main()
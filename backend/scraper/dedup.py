@@ -0,0 +1,203 @@
+import re
+import json
+import zlib
+import hashlib
+from array import array
+import numpy as np
+from backend.config import CHUNKS_JSONL, DEDUP_CHUNKS_JSONL
+
+'''
+Near-duplicate chunk detection, run between the chunker and the embedder.
+Listing pages and recipe variants produce chunks that are almost the same text, so we cluster
+them with MinHash + LSH and only keep one representative per cluster. The representative
+keeps every source url of its cluster in "urls" so nothing is lost for citations.
+
+Memory per representative is its NUM_PERM uint32 signature (256B) plus a 12B (key, slot)
+entry per LSH band and one for its exact-text digest, ~0.5KB in total. Duplicates only cost
+one byte plus their url. Recent entries sit in dicts (a few tens of MB at most) and get merged
+into sorted numpy arrays every MERGE_EVERY representatives, so a million distinct chunks fit in
+roughly 0.5GB. Shingling and signatures run in numpy, ~2ms per 3000-char chunk on one core,
+so about half an hour per million chunks.
+'''
+
+SHINGLE_WORDS = 5       # word n-grams used as the set for Jaccard similarity
+NUM_PERM      = 64      # minhash permutations
+BANDS         = 16      # LSH bands, NUM_PERM / BANDS rows each
+THRESHOLD     = 0.8     # estimated Jaccard at or above this counts as a duplicate
+MERGE_EVERY   = 20000   # representatives buffered in dicts before merging into sorted arrays
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> list:
+    """Lowercased word tokens, so whitespace/punctuation differences don't matter"""
+    return _WORD_RE.findall(text.lower())
+
+
+_GRAM_MULT = np.array([0x9E3779B97F4A7C15 ** i % 2**64 for i in range(SHINGLE_WORDS)], dtype=np.uint64)
+
+
+def shingle_hashes(tokens: list, k=SHINGLE_WORDS) -> np.ndarray:
+    """
+    Unique 64-bit hashes of the word k-grams of a chunk (whole chunk if it's shorter than k).
+    Each token is hashed once, k-grams are combined from token hashes in numpy.
+    """
+    tok = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    if len(tok) < k:
+        tok = np.concatenate([tok, np.zeros(k - len(tok), dtype=np.uint64)])
+    windows = np.lib.stride_tricks.sliding_window_view(tok, k)
+    with np.errstate(over="ignore"):
+        return np.unique((windows * _GRAM_MULT[:k]).sum(axis=1))
+
+
+class _SortedIndex:
+    """
+    uint64 key -> uint32 slot. New keys go in a dict and are merged into sorted
+    arrays in bulk, so the long-lived part costs 12 bytes per entry.
+    """
+    def __init__(self):
+        self.keys   = np.empty(0, dtype=np.uint64)
+        self.slots  = np.empty(0, dtype=np.uint32)
+        self.recent = {}
+
+    def get_many(self, keys: np.ndarray) -> list:
+        """Slot for each key, None where missing, one searchsorted for all of them"""
+        idx = np.searchsorted(self.keys, keys)
+        found = [None] * len(keys)
+        for j, key in enumerate(keys.tolist()):
+            slot = self.recent.get(key)
+            if slot is None:
+                i = int(idx[j])
+                if i < len(self.keys) and int(self.keys[i]) == key:
+                    slot = int(self.slots[i])
+            found[j] = slot
+        return found
+
+    def add_many(self, keys: np.ndarray, slot: int):
+        # first representative in a bucket keeps it
+        for key, existing in zip(keys.tolist(), self.get_many(keys)):
+            if existing is None:
+                self.recent[key] = slot
+
+    def merge(self):
+        if not self.recent:
+            return
+        n = len(self.recent)
+        keys  = np.concatenate([self.keys, np.fromiter(self.recent.keys(), dtype=np.uint64, count=n)])
+        slots = np.concatenate([self.slots, np.fromiter(self.recent.values(), dtype=np.uint32, count=n)])
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.slots = keys[order], slots[order]
+        self.recent.clear()
+
+
+class MinHashLSH:
+    """
+    Streaming MinHash-LSH index. add() returns the representative key of the
+    cluster a chunk joins, or its own key if it starts a new cluster.
+    """
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=THRESHOLD, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm  = num_perm
+        self.bands     = bands
+        self.rows      = num_perm // bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: h(x) = ((a*x + b) mod 2^64) >> 32, a odd
+        self._a = (rng.integers(0, 2**63, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._band_mult = rng.integers(1, 2**63, self.rows, dtype=np.uint64) | np.uint64(1)
+        # every band shares one index, keys are salted per band so they can't collide across bands
+        self._band_salt = rng.integers(0, 2**63, bands, dtype=np.uint64)
+        self._buckets = _SortedIndex()
+        self._exact   = _SortedIndex()  # text digest of representatives only
+        self._sigs    = np.empty((1024, num_perm), dtype=np.uint32)
+        self._keys    = []              # representative slot -> key
+        self._pending = 0
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            h = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return h.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig) -> np.ndarray:
+        rows = sig.reshape(self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            return (rows * self._band_mult).sum(axis=1) ^ self._band_salt
+
+    def add(self, key, text: str):
+        tokens = normalize(text)
+
+        # exact duplicates (after normalising) skip the minhash work entirely
+        digest = np.frombuffer(hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).digest(),
+                               dtype=np.uint64)
+        slot = self._exact.get_many(digest)[0]
+        if slot is not None:
+            return self._keys[slot]
+
+        sig = self.signature(shingle_hashes(tokens))
+        band_keys = self._band_keys(sig)
+        for slot in dict.fromkeys(s for s in self._buckets.get_many(band_keys) if s is not None):
+            if np.count_nonzero(sig == self._sigs[slot]) / self.num_perm >= self.threshold:
+                return self._keys[slot]
+
+        # new cluster, this chunk is its representative
+        slot = len(self._keys)
+        if slot == len(self._sigs):
+            self._sigs = np.resize(self._sigs, (slot * 2, self.num_perm))
+        self._sigs[slot] = sig
+        self._keys.append(key)
+        self._exact.add_many(digest, slot)
+        self._buckets.add_many(band_keys, slot)
+
+        self._pending += 1
+        if self._pending >= MERGE_EVERY:
+            self._buckets.merge()
+            self._exact.merge()
+            self._pending = 0
+        return key
+
+
+def load_chunks(path):
+    """Yield each chunk record from chunks.jsonl"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def dedup_chunks(in_path=CHUNKS_JSONL, out_path=DEDUP_CHUNKS_JSONL):
+    """
+    Two passes so chunk text never has to sit in memory:
+      1) cluster every chunk, remembering the extra urls each representative picks up
+      2) re-read and write only representatives, with all of their cluster's urls
+    """
+    lsh = MinHashLSH()
+    extra_urls = {}  # representative line -> urls of its duplicates
+    is_rep = array("b")
+    total = 0
+
+    for i, rec in enumerate(load_chunks(in_path)):
+        rep = lsh.add(i, rec['text'])
+        is_rep.append(rep == i)
+        if rep != i:
+            urls = extra_urls.setdefault(rep, [])
+            if rec['url'] not in urls:
+                urls.append(rec['url'])
+        total += 1
+
+    kept = 0
+    with open(out_path, 'w', encoding='utf-8') as out:
+        for i, rec in enumerate(load_chunks(in_path)):
+            if not is_rep[i]:
+                continue
+            urls = [rec['url']] + [u for u in extra_urls.get(i, []) if u != rec['url']]
+            rec['urls'] = urls
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            kept += 1
+
+    print(f"Kept {kept}/{total} chunks ({total - kept} near-duplicates dropped)")
+    return kept, total
+
+
+if __name__ == "__main__":
+    dedup_chunks()
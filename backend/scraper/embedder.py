@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 import os, json, time
-from backend.config import CHUNKS_JSONL  # path to data/chunks.jsonl
+from backend.config import CHUNKS_JSONL, DEDUP_CHUNKS_JSONL  # near-duplicates already removed by dedup.py
 from openai import OpenAI
 
 
@@ -34,10 +34,12 @@ def batch_iterator(iterable, size):
         yield batch
 
 def main():
-    #Setup output
-    with open(OUTPUT_PATH, 'w', encoding='utf-8') as out_f:
+    #Write to a temp file and swap it in at the end, a crash never leaves a truncated
+    #embeddings.jsonl for ingest_acs to treat as the full source
+    tmp_path = OUTPUT_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out_f:
         #Iterate over each batch of chunk records
-        for batch in batch_iterator(load_chunks(CHUNKS_JSONL), BATCH_SIZE):
+        for batch in batch_iterator(load_chunks(DEDUP_CHUNKS_JSONL), BATCH_SIZE):
             texts = [rec['text'] for rec in batch]
             #print(texts)
             # call embedding
@@ -58,6 +60,7 @@ def main():
                     "values": emb_item.embedding,
                     "metadata": {
                         "url":         rec['url'],
+                        "urls":        rec.get('urls', [rec['url']]),  # every page this text appeared on
                         "domain": rec['domain'],
                         "chunk_index": rec['chunk_index'],
                         "text_excerpt": rec['text'][:100],
@@ -69,6 +72,7 @@ def main():
             
             time.sleep(1)
 
+    os.replace(tmp_path, OUTPUT_PATH)
     print(f"Embeddings written to {OUTPUT_PATH}")
 
 if __name__ == "__main__":
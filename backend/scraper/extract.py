@@ -0,0 +1,184 @@
+import re
+import hashlib
+import itertools
+from collections import Counter
+from lxml import html as lxml_html
+
+'''
+HTML -> structured text blocks for the chunker.
+Uses lxml (libxml2, C-backed) instead of BeautifulSoup's pure-Python html.parser and keeps
+block structure (headings, list items, paragraphs) so the chunker can split on headings and
+keep ingredient lists together.
+
+Site chrome (header, nav, footer, cookie banner text) repeats on every page, so instead of
+hand-maintaining selectors BoilerplateFilter counts how many pages each block appears on across
+the crawl and strips the ones that show up on too many of them.
+'''
+
+# form controls only, a <form> can wrap a whole page (ASP.NET does) so its content is walked
+DROP_TAGS    = {"script", "style", "noscript", "svg", "iframe", "template", "input", "textarea", "button",
+                "select", "nav", "footer"}
+LIST_TAGS    = {"ul", "ol"}
+BLOCK_TAGS   = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "th", "dt", "dd",
+                "blockquote", "pre", "figcaption", "caption"}
+INLINE_TAGS  = {"a", "span", "strong", "em", "b", "i", "u", "small", "sup", "sub", "br", "img",
+                "label", "abbr", "mark", "time", "code", "cite", "q", "s", "font"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# consent banner containers, matched on id prefix or whole class token, never substrings,
+# recipe markup like "recipe-cookie-card" must survive
+COOKIE_ID_PREFIXES = ("onetrust-", "ot-sdk-", "cookie-banner", "cookie-consent", "cookie-notice",
+                      "cookiebot", "cybotcookiebot")
+COOKIE_CLASSES     = {"cookie-banner", "cookie-consent", "cookie-notice", "cookie-bar", "consent-banner",
+                      "optanon-alert-box-wrapper", "ot-sdk-container", "ot-sdk-row"}
+
+BOILERPLATE_RATIO = 0.3  # block on >= 30% of pages is boilerplate
+MIN_PAGES         = 20   # don't judge frequency on a tiny crawl
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _clean(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _kind(tag: str) -> str:
+    if tag in HEADING_TAGS:
+        return "heading"
+    if tag == "li":
+        return "li"
+    return "text"
+
+
+def _is_cookie_banner(el) -> bool:
+    if el.get("id", "").lower().startswith(COOKIE_ID_PREFIXES):
+        return True
+    if COOKIE_CLASSES & set(el.get("class", "").lower().split()):
+        return True
+    if el.get("role") in ("dialog", "alertdialog"):
+        label = el.get("aria-label", "").lower()
+        return "cookie" in label or "consent" in label
+    return False
+
+
+def _dropped(el) -> bool:
+    tag = el.tag if isinstance(el.tag, str) else ""  # comments / processing instructions
+    return not tag or tag in DROP_TAGS or _is_cookie_banner(el)
+
+
+def _block_text(el) -> str:
+    """Like text_content() but skipping scripts, buttons etc. nested in the block"""
+    parts = [el.text or ""]
+    for child in el:
+        if not _dropped(child):
+            parts.append(_block_text(child))
+        parts.append(child.tail or "")
+    return " ".join(parts)
+
+
+def _flush(buf, blocks):
+    text = _clean(" ".join(buf))
+    if text:
+        blocks.append({"kind": "text", "text": text})
+    buf.clear()
+
+
+def _walk(el, blocks, buf, lists, list_id=None):
+    if _dropped(el):
+        return
+    tag = el.tag
+    if tag in BLOCK_TAGS:
+        _flush(buf, blocks)
+        text = _clean(_block_text(el))
+        if text:
+            block = {"kind": _kind(tag), "text": text}
+            if tag == "li":
+                block["list"] = list_id  # which <ul>/<ol> it came from, lists are judged one by one
+            blocks.append(block)
+        return
+    if tag in LIST_TAGS:
+        list_id = next(lists)
+
+    # loose text inside containers (div, section...) becomes its own block
+    inline = tag in INLINE_TAGS
+    if not inline:
+        _flush(buf, blocks)
+    if el.text:
+        buf.append(el.text)
+    for child in el:
+        _walk(child, blocks, buf, lists, list_id)
+        if child.tail:
+            buf.append(child.tail)
+    if not inline:
+        _flush(buf, blocks)
+
+
+def extract_blocks(html: str) -> list:
+    """
+    Parse a page into [{"kind": "heading"|"li"|"text", "text": ...}] in document order.
+    List items also carry "list", an id shared by the items of the same <ul>/<ol>.
+    """
+    if not html or not html.strip():
+        return []
+    root = lxml_html.document_fromstring(html)
+    body = root.find("body")
+    blocks, buf = [], []
+    _walk(body if body is not None else root, blocks, buf, itertools.count())
+    _flush(buf, blocks)
+    return blocks
+
+
+def blocks_to_text(blocks) -> str:
+    """Flat text with light markup the chunker (and the LLM) can read structure from"""
+    lines = []
+    for b in blocks:
+        if b["kind"] == "heading":
+            lines.append(f"## {b['text']}")
+        elif b["kind"] == "li":
+            lines.append(f"- {b['text']}")
+        else:
+            lines.append(b["text"])
+    return "\n".join(lines)
+
+
+def block_key(block) -> bytes:
+    return hashlib.blake2b(block["text"].lower().encode("utf-8"), digest_size=8).digest()
+
+
+class BoilerplateFilter:
+    """
+    Learns boilerplate from block frequency across pages.
+    Call observe() once per page over the whole crawl, then strip() each page.
+    Headings are never stripped, "Ingredients" on every recipe is structure, not chrome.
+    List items are judged per list: a list is dropped only if every item in it is frequent,
+    so a nav menu goes but an ingredient list with "2 large eggs" in it stays whole, even when
+    the two lists sit right next to each other.
+    """
+    def __init__(self, ratio=BOILERPLATE_RATIO, min_pages=MIN_PAGES):
+        self.ratio     = ratio
+        self.min_pages = min_pages
+        self.pages     = 0
+        self.counts    = Counter()  # block key -> number of pages containing it
+
+    def observe(self, blocks):
+        self.pages += 1
+        self.counts.update({block_key(b) for b in blocks})
+
+    def is_boilerplate(self, block) -> bool:
+        if block["kind"] == "heading" or self.pages < self.min_pages:
+            return False
+        return self.counts[block_key(block)] / self.pages >= self.ratio
+
+    def strip(self, blocks) -> list:
+        kept, run = [], []
+        for b in blocks + [None]:
+            if run and (b is None or b["kind"] != "li" or b.get("list") != run[0].get("list")):
+                if not all(self.is_boilerplate(li) for li in run):
+                    kept.extend(run)
+                run = []
+            if b is None:
+                break
+            if b["kind"] == "li":
+                run.append(b)
+            elif not self.is_boilerplate(b):
+                kept.append(b)
+        return kept
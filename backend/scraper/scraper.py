@@ -5,9 +5,9 @@ import argparse
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from bs4 import BeautifulSoup
 from selenium.common.exceptions import NoSuchElementException
 from backend.config import PAGES_JSONL
+from backend.scraper.extract import extract_blocks, blocks_to_text
 
 
 # Constants
@@ -91,8 +91,7 @@ def parse_html(html: str) -> str:
     """
     Strip HTML tags and return clean text.
     """
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(separator=" ", strip=True)
+    return blocks_to_text(extract_blocks(html))
 
 
 def ensure_data_dir():
@@ -125,11 +124,12 @@ def expand_all(driver):
             # log and stop if something unexpected happens
             print(f"[expand_all] warning: {e}")
             break
-def saveRecord(url, text):
+def saveRecord(url, blocks):
+    # blocks keep headings/list structure, boilerplate is stripped later by the chunker
     record = {
                 "url": url,
                 "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
-                "text": text
+                "blocks": blocks
             }
     save_record(record)
 
@@ -170,8 +170,8 @@ def main():
             expand_all(driver)
             
             html = driver.page_source
-            text = parse_html(html)
-            saveRecord(url, text)
+            blocks = extract_blocks(html)
+            saveRecord(url, blocks)
 
             print(f"Scraped and saved: {url}")
 
@@ -0,0 +1,154 @@
+import time
+import threading
+
+import pytest
+
+from backend.api.admission import AdmissionController, Overloaded, ResponseCache
+
+
+class SlowUpstream:
+    """Fake LLM: each call holds a slot for `delay` seconds and tracks peak concurrency."""
+    def __init__(self, delay):
+        self.delay  = delay
+        self.active = 0
+        self.peak   = 0
+        self._lock  = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+
+
+def run_clients(gate, upstream, n, client_id=lambda i: f"c{i}", timeout=None):
+    """n threads calling upstream through gate, returns (served, rejected) counts and the errors"""
+    served, errors = [], []
+    lock = threading.Lock()
+
+    def worker(i):
+        try:
+            with gate.slot(client_id(i), timeout=timeout):
+                upstream.call()
+            with lock:
+                served.append(i)
+        except Overloaded as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(served), errors
+
+
+def hold(gate, client_id="holder", n=1):
+    """Fill n slots and return a callback that frees them"""
+    for _ in range(n):
+        gate.acquire(client_id)
+    return lambda: [gate.release(client_id) for _ in range(n)]
+
+
+def test_concurrency_is_bounded_and_overflow_is_shed():
+    gate = AdmissionController(max_concurrent=2, max_queue=2, queue_timeout=5)
+    upstream = SlowUpstream(delay=0.2)
+    start = time.monotonic()
+    served, errors = run_clients(gate, upstream, 10)
+    assert upstream.peak == 2
+    assert served == 4  # 2 running + 2 queued
+    assert len(errors) == 6 and all(e.status_code == 503 for e in errors)
+    # shed callers fail fast instead of waiting for the upstream
+    assert time.monotonic() - start < 1.0
+
+
+def test_queue_deadline_gives_up():
+    gate = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.1)
+    free = hold(gate)
+    start = time.monotonic()
+    with pytest.raises(Overloaded, match="deadline"):
+        gate.acquire("late")
+    assert 0.1 <= time.monotonic() - start < 0.5
+    free()
+    assert gate._by_client == {} and gate._queue == []
+
+
+def test_zero_timeout_never_waits():
+    gate = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=5)
+    free = hold(gate)
+    with pytest.raises(Overloaded, match="queue full"):
+        gate.acquire("optional", timeout=0)
+    free()
+    gate.acquire("optional", timeout=0)
+    gate.release("optional")
+
+
+def test_per_client_cap_returns_429():
+    gate = AdmissionController(max_concurrent=10, max_queue=10, queue_timeout=1, per_client_max=2)
+    free = hold(gate, "greedy", n=2)
+    with pytest.raises(Overloaded) as exc:
+        gate.acquire("greedy")
+    assert exc.value.status_code == 429
+    gate.acquire("other")
+    gate.release("other")
+    free()
+
+
+def admitted_order(gate, waiters):
+    """Queue (client_id, priority) waiters behind a full gate and return the order they get in"""
+    order, lock = [], threading.Lock()
+    free = hold(gate)
+
+    def worker(client_id, priority):
+        with gate.slot(client_id, priority):
+            with lock:
+                order.append(client_id)
+            time.sleep(0.01)
+
+    threads = []
+    for client_id, priority in waiters:
+        t = threading.Thread(target=worker, args=(client_id, priority))
+        t.start()
+        threads.append(t)
+        while len(gate._queue) < len(threads):  # make sure they queue in this order
+            time.sleep(0.001)
+    free()
+    for t in threads:
+        t.join()
+    return order
+
+
+def test_lower_priority_number_goes_first():
+    gate = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+    order = admitted_order(gate, [("new1", 1), ("new2", 1), ("followup", 0)])
+    assert order == ["followup", "new1", "new2"]
+
+
+def test_fair_share_prefers_client_with_fewer_running():
+    gate = AdmissionController(max_concurrent=2, max_queue=10, queue_timeout=5)
+    gate.acquire("busy")  # busy already has a call running
+    order = admitted_order(gate, [("busy", 1), ("quiet", 1)])
+    gate.release("busy")
+    assert order == ["quiet", "busy"]
+
+
+def test_slot_releases_on_error():
+    gate = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1)
+    with pytest.raises(RuntimeError):
+        with gate.slot("c"):
+            raise RuntimeError("upstream blew up")
+    assert gate._active == 0 and gate._by_client == {}
+
+
+def test_response_cache_ttl_and_lru():
+    cache = ResponseCache(max_items=2, ttl=60)
+    cache.put("What is  Milo?", {"answer": "a"})
+    assert cache.get("what is milo?") == {"answer": "a"}
+    cache.put("q2", 2)
+    cache.put("q3", 3)
+    assert cache.get("what is milo?") is None  # evicted, least recently used
+    cache.ttl = 0
+    assert cache.get("q3") is None
@@ -0,0 +1,147 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from backend.vector_store.uploader import doc_hash, size_batches, sync_documents
+
+
+class FakeSearchClient:
+    """
+    Stands in for SearchClient: keeps the index in a dict and can fail
+    chosen keys with a given status a set number of times.
+    """
+    def __init__(self, ids=(), fail=None):
+        self.index = {k: {"id": k} for k in ids}
+        self.fail  = dict(fail or {})  # key -> [status, remaining failures]
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _results(self, documents, apply):
+        results = []
+        with self._lock:
+            self.calls.append([d["id"] for d in documents])
+            for d in documents:
+                status, left = self.fail.get(d["id"], (None, 0))
+                if left:
+                    self.fail[d["id"]] = (status, left - 1)
+                    results.append(SimpleNamespace(key=d["id"], succeeded=False, status_code=status,
+                                                   error_message="fake failure"))
+                    continue
+                apply(d)
+                results.append(SimpleNamespace(key=d["id"], succeeded=True, status_code=200, error_message=None))
+        return results
+
+    def merge_or_upload_documents(self, documents):
+        return self._results(documents, lambda d: self.index.__setitem__(d["id"], d))
+
+    def delete_documents(self, documents):
+        return self._results(documents, lambda d: self.index.pop(d["id"], None))
+
+    def search(self, search_text, select=None):
+        with self._lock:
+            return [{k: v for k, v in d.items() if not select or k in select} for d in self.index.values()]
+
+
+def docs(n, text="x"):
+    return [{"id": f"d{i}", "text": f"{text}{i}"} for i in range(n)]
+
+
+def sync(client, source, tmp_path, **kw):
+    kw.setdefault("sleep", lambda s: None)
+    return sync_documents(client, source, manifest_path=str(tmp_path / "manifest.json"), **kw)
+
+
+def test_size_batches_respects_byte_limit():
+    batch_docs = [{"id": str(i), "text": "a" * 100} for i in range(50)]
+    limit = len(json.dumps(batch_docs[0])) * 5
+    batches = list(size_batches(batch_docs, max_bytes=limit))
+    assert sum(len(b) for b in batches) == 50
+    assert all(len(b) <= 5 for b in batches)
+
+
+def test_rerun_only_sends_changed_docs(tmp_path):
+    client = FakeSearchClient()
+    first = sync(client, docs(10), tmp_path)
+    assert first["uploaded"] == 10
+
+    source = docs(10)
+    source[3]["text"] = "changed"
+    client.calls.clear()
+    second = sync(client, source, tmp_path)
+    assert second["uploaded"] == 1 and second["unchanged"] == 9
+    assert client.calls == [["d3"]]
+
+
+def test_hash_ignore_skips_timestamp_only_changes():
+    a = {"id": "1", "text": "t", "timestamp": 1}
+    b = dict(a, timestamp=2)
+    assert doc_hash(a) != doc_hash(b)
+    assert doc_hash(a, ignore=("timestamp",)) == doc_hash(b, ignore=("timestamp",))
+
+
+def test_missing_manifest_is_rebuilt_from_index(tmp_path):
+    # documents from an earlier load with no manifest on disk must still be cleaned up
+    client = FakeSearchClient(ids=["d0", "d1", "old"])
+    stats = sync(client, docs(2), tmp_path, max_delete_ratio=0.5)
+    assert stats["uploaded"] == 2  # content unknown, re-sent
+    assert stats["deleted"] == 1
+    assert set(client.index) == {"d0", "d1"}
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert set(manifest) == {"d0", "d1"}
+
+
+def test_mass_delete_is_held_back_without_force(tmp_path):
+    client = FakeSearchClient()
+    sync(client, docs(10), tmp_path)
+
+    # truncated source, most ids missing
+    stats = sync(client, docs(2), tmp_path)
+    assert stats["deleted"] == 0 and stats["held_back"] == 8
+    assert len(client.index) == 10
+    assert len(json.loads((tmp_path / "manifest.json").read_text())) == 10
+
+    stats = sync(client, docs(2), tmp_path, force=True)
+    assert stats["deleted"] == 8
+    assert set(client.index) == {"d0", "d1"}
+
+
+def test_retryable_failures_are_retried_and_rejects_reported(tmp_path):
+    client = FakeSearchClient(fail={"d1": (503, 2), "d2": (400, 1)})
+    stats = sync(client, docs(4), tmp_path)
+    assert stats["uploaded"] == 3
+    assert stats["rejected"] == ["d2"] and stats["failed"] == []
+
+    # the rejected doc isn't in the manifest, so the next run sends it again
+    client.calls.clear()
+    stats = sync(client, docs(4), tmp_path)
+    assert client.calls == [["d2"]] and stats["uploaded"] == 1
+
+
+def test_exhausted_retries_stay_out_of_the_manifest(tmp_path):
+    client = FakeSearchClient(fail={"d0": (429, 10)})
+    stats = sync(client, docs(3), tmp_path, max_retries=2)
+    assert stats["failed"] == ["d0"]
+    assert "d0" not in json.loads((tmp_path / "manifest.json").read_text())
+
+
+def test_unconfirmed_deletes_stay_in_the_manifest(tmp_path):
+    client = FakeSearchClient()
+    sync(client, docs(10), tmp_path)
+    client.fail["d9"] = (503, 10)
+    stats = sync(client, docs(9), tmp_path, max_retries=1)
+    assert stats["deleted"] == 0 and stats["failed"] == ["d9"]
+    assert "d9" in json.loads((tmp_path / "manifest.json").read_text())
+
+
+def test_batches_run_concurrently(tmp_path):
+    barrier = threading.Barrier(2, timeout=5)
+
+    class Concurrent(FakeSearchClient):
+        def merge_or_upload_documents(self, documents):
+            barrier.wait()  # deadlocks (and times out) unless two batches are in flight together
+            return super().merge_or_upload_documents(documents)
+
+    client = Concurrent()
+    source = [{"id": f"d{i}", "text": "a" * 200} for i in range(4)]
+    stats = sync(client, source, tmp_path, max_batch_bytes=300, max_in_flight=2)
+    assert stats["uploaded"] == 4 and not stats["failed"]
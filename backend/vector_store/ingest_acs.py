@@ -1,8 +1,10 @@
-import os, json, time
+import os, json
+import argparse
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from backend.config import CHUNKS_JSONL
+from backend.vector_store.uploader import sync_documents
 import re
 
 # 1) Load .env
@@ -16,34 +18,11 @@ vector_field = "contentVector"
 credential    = AzureKeyCredential(admin_key)
 search_client = SearchClient(endpoint=endpoint, index_name=index_name, credential=credential)
 
-'''
-
-#------WILL DELETE ALL DOCS -------- only un comment to clear and reset docs
-
-results = search_client.search(
-    search_text="*",
-    select=["id"],
-    top=1000,
-    include_total_count=True
-)
-
-ids = [doc["id"] for doc in results]
-
-print(f"Found {len(ids)} documents; deleting…")
-
-# batch‐delete by key
-if ids:
-    delete_actions = [{"id": doc_id} for doc_id in ids]
-    delete_results = search_client.delete_documents(documents=delete_actions)
-    succeeded = sum(1 for r in delete_results if r.succeeded)
-    print(f"✅ Deleted {succeeded}/{len(delete_actions)} documents.")
-else:
-    print(" No documents found to delete.")
-
-'''
 
 #Path to your embeddings.jsonl
 EMBEDDINGS_JSONL = os.path.join(os.path.dirname(CHUNKS_JSONL), "embeddings.jsonl")
+#Ids + content hashes already in the index, lets reruns only send what changed
+MANIFEST_JSON = os.path.join(os.path.dirname(CHUNKS_JSONL), "acs_manifest.json")
 
 #Loader
 def load_embeddings(path):
@@ -59,21 +38,22 @@ def load_embeddings(path):
                 "timestamp":    doc["metadata"]["timestamp"],
                 vector_field:   doc["values"]
             }
-#Batcher to reduce calls
-def batch_iterator(iterable, size=100):
-    batch = []
-    for item in iterable:
-        batch.append(item)
-        if len(batch) == size:
-            yield batch
-            batch = []
-    if batch:
-        yield batch
-
-#Upload all embeddings
-for batch in batch_iterator(load_embeddings(EMBEDDINGS_JSONL), size=100):
-    print(f"Uploading {len(batch)} docs…")
-    search_client.upload_documents(documents=batch)
-    time.sleep(1)
 
-print("All embeddings uploaded")
\ No newline at end of file
+#Sync embeddings into the index, only changed docs are uploaded and removed ones deleted
+def main(force=False):
+    stats = sync_documents(search_client, load_embeddings(EMBEDDINGS_JSONL),
+                           manifest_path=MANIFEST_JSON, hash_ignore=("timestamp",), force=force)
+    if stats["held_back"]:
+        print(f"{stats['held_back']} deletes held back, rerun with --force if the source really shrank")
+    if stats["rejected"]:
+        print(f"{len(stats['rejected'])} docs rejected by the index, check the errors above")
+    if stats["failed"]:
+        print(f"{len(stats['failed'])} docs failed, rerun to retry them")
+    if not stats["failed"] and not stats["rejected"]:
+        print("All embeddings synced")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync embeddings.jsonl into Azure Cognitive Search")
+    parser.add_argument("--force", action="store_true",
+                        help="delete stale docs even if that removes a large share of the index")
+    main(force=parser.parse_args().force)
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+'''
+Delta uploader for Azure Cognitive Search.
+Batches documents by serialised size instead of count, keeps several batches in flight,
+retries per-document failures with backoff and only sends documents whose content changed
+since the last run (tracked in a local manifest). Ids that disappeared from the source are
+deleted by diffing against the manifest, so the index is never wiped and re-filled.
+Without a manifest the ids are read back from the index first, so documents left over from
+earlier loads are still cleaned up. Deletes are capped at MAX_DELETE_RATIO of the manifest,
+a truncated source file must not empty the index.
+
+Works with anything exposing SearchClient's merge_or_upload_documents / delete_documents,
+which makes it easy to run against a fake client.
+'''
+
+MAX_BATCH_BYTES = 8 * 1024 * 1024  # ACS rejects request bodies over 16MB, stay well under
+MAX_BATCH_DOCS  = 1000             # ACS hard limit per indexing request
+MAX_IN_FLIGHT   = 4                # concurrent batches
+MAX_RETRIES     = 5
+BACKOFF_BASE    = 1.0              # seconds, doubled each retry
+RETRYABLE_STATUS = {409, 422, 429, 500, 503}
+MAX_DELETE_RATIO = 0.2             # refuse to delete more than this share of the index without force
+UNKNOWN_HASH     = ""              # ids read back from the index, content unknown so always re-sent
+
+
+def doc_hash(doc: dict, ignore=()) -> str:
+    """Stable content hash of a document, used to detect changes between runs"""
+    if ignore:
+        doc = {k: v for k, v in doc.items() if k not in ignore}
+    payload = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path) -> dict:
+    """Read {doc_id: content_hash} from the last successful run, empty if none"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def manifest_from_index(search_client, key_field="id") -> dict:
+    """
+    Rebuild a manifest from the ids already in the index, used when the local one is missing.
+    The search pager follows continuation tokens, so this reads every id in the index.
+    """
+    return {r[key_field]: UNKNOWN_HASH for r in search_client.search("*", select=[key_field])}
+
+
+def save_manifest(path, manifest: dict):
+    """Write the manifest atomically so a crash never leaves it half written"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def size_batches(docs, max_bytes=MAX_BATCH_BYTES, max_docs=MAX_BATCH_DOCS):
+    """
+    Group docs into batches whose serialised JSON stays under max_bytes.
+    A single doc larger than max_bytes is still sent on its own.
+    """
+    batch, batch_bytes = [], 0
+    for doc in docs:
+        size = len(json.dumps(doc, ensure_ascii=False).encode("utf-8")) + 1
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_docs):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(doc)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def _send_with_retries(send, batch, key_field, max_retries, backoff_base, sleep):
+    """
+    Send one batch, retrying only the documents that failed with a retryable status.
+    Returns (succeeded_keys, failed_keys, rejected_keys), failed = retries exhausted,
+    rejected = non-retryable status from ACS.
+    """
+    pending = batch
+    succeeded, rejected = [], []
+    for attempt in range(max_retries + 1):
+        try:
+            results = send(documents=pending)
+        except Exception as e:
+            # whole request failed (throttled, timeout, connection reset), retry all of it
+            print(f"[uploader] batch of {len(pending)} failed: {e}")
+            if attempt == max_retries:
+                break
+            sleep(backoff_base * (2 ** attempt))
+            continue
+
+        by_key = {doc[key_field]: doc for doc in pending}
+        retry = []
+        for r in results:
+            if r.succeeded:
+                succeeded.append(r.key)
+            elif r.status_code in RETRYABLE_STATUS:
+                retry.append(by_key[r.key])
+            else:
+                print(f"[uploader] {r.key} rejected ({r.status_code}): {r.error_message}")
+                rejected.append(r.key)
+        pending = retry
+        if not pending:
+            break
+        if attempt < max_retries:
+            sleep(backoff_base * (2 ** attempt))
+
+    failed = [doc[key_field] for doc in pending]
+    return succeeded, failed, rejected
+
+
+def sync_documents(search_client, docs, manifest_path=None, key_field="id", hash_ignore=(),
+                   max_batch_bytes=MAX_BATCH_BYTES, max_in_flight=MAX_IN_FLIGHT,
+                   max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, sleep=time.sleep,
+                   max_delete_ratio=MAX_DELETE_RATIO, force=False):
+    """
+    Bring the index in line with docs:
+      1) merge_or_upload every doc whose hash differs from the manifest
+      2) delete ids that are in the manifest but no longer in docs
+      3) save the manifest with only what actually made it into the index
+    Fields in hash_ignore (e.g. crawl timestamps) don't count as a change on their own.
+    Documents are streamed, only the batches in flight are held in memory.
+    If the deletes would remove more than max_delete_ratio of the manifest they are held back
+    (and stay in the manifest) unless force is set.
+    Returns counts plus the keys that failed after retries and the keys ACS rejected outright.
+    """
+    if manifest_path and not os.path.exists(manifest_path):
+        manifest = manifest_from_index(search_client, key_field)
+        print(f"[uploader] no manifest, read {len(manifest)} ids back from the index")
+    else:
+        manifest = load_manifest(manifest_path)
+    current = {}      # id -> hash, the only per-doc state kept for the whole run
+    changed = [0]
+
+    def changed_docs():
+        # hash while streaming so only the batches in flight hold full documents
+        for doc in docs:
+            h = doc_hash(doc, hash_ignore)
+            current[doc[key_field]] = h
+            if manifest.get(doc[key_field]) != h:
+                changed[0] += 1
+                yield doc
+
+    # start from the old manifest, entries only change once ACS confirms them
+    new_manifest = dict(manifest)
+    uploaded, failed, rejected = 0, [], []
+
+    def collect(fut):
+        nonlocal uploaded
+        ok, bad, refused = fut.result()
+        for k in ok:
+            new_manifest[k] = current[k]
+        uploaded += len(ok)
+        failed.extend(bad)
+        rejected.extend(refused)
+
+    # 1) Upload changed docs, at most max_in_flight batches built and outstanding at once
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = set()
+        for batch in size_batches(changed_docs(), max_batch_bytes):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    collect(fut)
+            in_flight.add(pool.submit(_send_with_retries, search_client.merge_or_upload_documents,
+                                      batch, key_field, max_retries, backoff_base, sleep))
+        for fut in wait(in_flight).done:
+            collect(fut)
+
+    stale = [k for k in manifest if k not in current]
+    unchanged = len(current) - changed[0]
+    print(f"[uploader] {changed[0]} changed, {unchanged} unchanged, {len(stale)} stale")
+
+    # 2) Delete ids that no longer exist in the source, only confirmed deletes leave the manifest
+    deleted, held_back = 0, 0
+    if stale and not force and len(stale) > max_delete_ratio * len(manifest):
+        print(f"[uploader] refusing to delete {len(stale)}/{len(manifest)} docs "
+              f"(over {max_delete_ratio:.0%}), is the source complete? rerun with force to delete them")
+        held_back, stale = len(stale), []
+    delete_docs = [{key_field: k} for k in stale]
+    for batch in size_batches(delete_docs, max_batch_bytes):
+        ok, bad, refused = _send_with_retries(search_client.delete_documents, batch,
+                                              key_field, max_retries, backoff_base, sleep)
+        for k in ok:
+            new_manifest.pop(k, None)
+        deleted += len(ok)
+        failed.extend(bad)
+        rejected.extend(refused)
+
+    # 3) Persist progress, anything not confirmed is retried next run
+    if manifest_path:
+        save_manifest(manifest_path, new_manifest)
+
+    print(f"[uploader] uploaded {uploaded}, deleted {deleted}, failed {len(failed)}, rejected {len(rejected)}")
+    return {"uploaded": uploaded, "deleted": deleted, "held_back": held_back, "unchanged": unchanged,
+            "failed": failed, "rejected": rejected}
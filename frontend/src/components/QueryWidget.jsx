@@ -5,6 +5,7 @@ export default function QueryWidget() {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
   const [open, setOpen] = useState(false);
+  const [sessionId, setSessionId] = useState(null); // server keeps the history, we only send the id
   const messagesEndRef = useRef(null);
 
   useEffect(() => {
@@ -31,14 +32,15 @@ export default function QueryWidget() {
       const res = await fetch(url, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ question: userMsg.content })
+        body: JSON.stringify({ question: userMsg.content, session_id: sessionId })
       });
       //console.log("SENT REQ")
       if (!res.ok) {
         const err = await res.json();
         throw new Error(err.message || 'Unknown error');
       }
-      const { answer } = await res.json();
+      const { answer, session_id } = await res.json();
+      if (session_id) setSessionId(session_id);
       const botMsg = { role: 'assistant', content: answer };
       setMessages(prev => [...prev, botMsg]);
     } catch (err) {